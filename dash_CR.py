@@ -1,11 +1,32 @@
 import streamlit as st
 import pandas as pd
 import os
+import re
+import uuid
+from functools import lru_cache
 from datetime import datetime, timedelta
 import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Patrón de nombre de los archivos de ventas (fecha.xlsx, fecha_1.xlsx, fecha.parquet...)
+PATRON_ARCHIVO_VENTAS = re.compile(r"^(\d{4}-\d{2}-\d{2}(?:_\d+)?)\.(xlsx|parquet)$")
+
+# Columnas de los archivos de ventas que usa el dashboard
+COLUMNAS_VENTAS = ('Fecha', 'Ganancia', 'Producto', 'Talla', 'Cantidad Vendida', 'Costo')
+
+# Esquema común de las ventas: todas las tablas se convierten a él antes de unirlas
+ESQUEMA_VENTAS = pa.schema([
+    ('Fecha', pa.timestamp('ns')),
+    ('Ganancia', pa.float64()),
+    ('Producto', pa.string()),
+    ('Talla', pa.string()),
+    ('Cantidad Vendida', pa.int64()),
+    ('Costo', pa.float64())
+])
+
+# Posición de cada talla en el orden de despliegue
+ORDEN_TALLAS = {talla: i for i, talla in enumerate(['XS', 'S', 'M', 'L', 'XL', '2XL', '3XL', '4XL', '5XL'])}
 
 # Configuración de la página
 st.set_page_config(
@@ -23,49 +44,177 @@ def verificar_stock_bajo(df_maestro, umbral=5):
     return stock_bajo
 
 # Función para ordenar tallas
+@lru_cache(maxsize=64)
 def ordenar_tallas(tallas):
     """
     Ordena las tallas según el orden especificado: XS, S, M, L, XL, 2XL, 3XL, 4XL, 5XL
+    Recibe una tupla para poder guardar el resultado en caché
     """
-    orden_tallas = ['XS', 'S', 'M', 'L', 'XL', '2XL', '3XL', '4XL', '5XL']
-    tallas_ordenadas = []
-    
-    for talla_orden in orden_tallas:
-        if talla_orden in tallas:
-            tallas_ordenadas.append(talla_orden)
-    
-    # Agregar tallas que no están en el orden predefinido al final
-    for talla in tallas:
-        if talla not in tallas_ordenadas:
-            tallas_ordenadas.append(talla)
-    
-    return tallas_ordenadas
+    # Las tallas que no están en el orden predefinido quedan al final (sorted es estable)
+    return tuple(sorted(tallas, key=lambda talla: ORDEN_TALLAS.get(talla, len(ORDEN_TALLAS))))
+
+# Función para leer un archivo Excel con caché
+# (ttl y max_entries descartan las copias del archivo maestro de versiones anteriores)
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=500)
+def _leer_excel_cacheado(ruta, mtime, columnas=None, columnas_fecha=None):
+    """
+    Lee un archivo Excel y guarda el resultado en caché.
+    La fecha de modificación (mtime) forma parte de la llave, por lo que
+    cualquier cambio en el archivo invalida la entrada automáticamente.
+    Si se indican columnas, solo se leen esas columnas; las columnas de
+    fecha se convierten a datetime al leer.
+    """
+    return pd.read_excel(ruta, engine="calamine", usecols=columnas, parse_dates=list(columnas_fecha or []))
 
 # Función para cargar datos de ventas
 def cargar_datos_ventas():
     """
     Carga todos los archivos de ventas para generar estadísticas
     """
-    archivos_ventas = []
-    datos_ventas = []
-    
-    # Buscar todos los archivos de ventas (formato fecha.xlsx)
-    for archivo in os.listdir("."):
-        if archivo.endswith(".xlsx") and archivo != "CR_Control.xlsx":
-            try:
-                # Verificar si es un archivo de ventas válido
-                df_temp = pd.read_excel(archivo)
-                if 'Fecha' in df_temp.columns and 'Ganancia' in df_temp.columns:
-                    df_temp['Archivo'] = archivo
-                    datos_ventas.append(df_temp)
-            except:
-                continue
-    
-    if datos_ventas:
-        return pd.concat(datos_ventas, ignore_index=True)
+    archivos_ventas = {}
+    tablas_ventas = []
+    
+    # Buscar los archivos de ventas por su nombre, sin abrirlos
+    with os.scandir(".") as entradas:
+        for entrada in entradas:
+            coincidencia = PATRON_ARCHIVO_VENTAS.match(entrada.name)
+            if coincidencia and entrada.is_file():
+                nombre_base, extension = coincidencia.groups()
+                archivos_ventas.setdefault(nombre_base, {})[extension] = entrada
+    
+    for nombre_base, copias in archivos_ventas.items():
+        # Preferir la copia Parquet; las ventas anteriores solo existen en Excel
+        if 'parquet' in copias:
+            tabla = pq.read_table(copias['parquet'].name, columns=list(COLUMNAS_VENTAS))
+        else:
+            entrada = copias['xlsx']
+            df_temp = _leer_excel_cacheado(entrada.name, entrada.stat().st_mtime_ns, COLUMNAS_VENTAS, ('Fecha',))
+            # Tallas que mezclan números y letras en un mismo archivo se leen como object
+            df_temp = df_temp.astype({'Producto': str, 'Talla': str})
+            tabla = pa.Table.from_pandas(df_temp, preserve_index=False)
+        # Mismo orden y tipos en todas las tablas (por ejemplo, Talla 40 en un archivo y 'M' en otro)
+        tabla = tabla.select(list(COLUMNAS_VENTAS)).cast(ESQUEMA_VENTAS)
+        tabla = tabla.append_column('Archivo', pa.array([nombre_base + ".xlsx"] * tabla.num_rows))
+        tablas_ventas.append(tabla)
+    
+    # Unir en Arrow (sin copiar columnas) y convertir a pandas una sola vez
+    if tablas_ventas:
+        tabla_ventas = pa.concat_tables(tablas_ventas)
+        df_ventas = tabla_ventas.to_pandas(split_blocks=True, self_destruct=True)
+        
+        # Columnas de texto con pocos valores distintos como categorías (agrupaciones más rápidas)
+        # y tipos numéricos más pequeños para reducir memoria (entero con nulos: hay celdas vacías)
+        df_ventas = df_ventas.astype({
+            'Producto': 'category',
+            'Talla': 'category',
+            'Archivo': 'category',
+            'Cantidad Vendida': 'Int32',
+            'Costo': 'float32'
+        })
+        
+        return df_ventas
     else:
         return pd.DataFrame()
 
+# Función para generar el gráfico de productos más vendidos
+@st.cache_data(show_spinner=False, max_entries=10)
+def _figura_top_productos(top_productos):
+    """
+    Genera el gráfico de barras de los productos/tallas más vendidos.
+    Se guarda en caché según el contenido de los datos agregados.
+    """
+    # Plotly solo se usa en el dashboard: se importa aquí para no cargarlo en el sistema de ventas
+    import plotly.graph_objects as go
+    
+    fig = go.Figure(go.Bar(
+        x=top_productos['Cantidad Vendida'].to_numpy(),
+        y=top_productos['Producto_Talla'].to_numpy(),
+        orientation='h',
+        marker=dict(
+            color=top_productos['Cantidad Vendida'].to_numpy(),
+            colorscale='Blues',
+            showscale=True,
+            colorbar=dict(title='Unidades Vendidas')
+        )
+    ))
+    fig.update_layout(
+        title="Top 10 Productos/Tallas Más Vendidos",
+        xaxis_title='Unidades Vendidas',
+        yaxis_title='Producto (Talla)',
+        height=500
+    )
+    return fig
+
+# Función para generar el gráfico de ganancias por producto
+@st.cache_data(show_spinner=False, max_entries=10)
+def _figura_ganancias_por_producto(ganancias_por_producto):
+    """
+    Genera el gráfico de pastel con la distribución de ganancias por producto.
+    Se guarda en caché según el contenido de los datos agregados.
+    """
+    import plotly.graph_objects as go
+    
+    fig = go.Figure(go.Pie(
+        labels=ganancias_por_producto['Producto'].to_numpy(),
+        values=ganancias_por_producto['Ganancia'].to_numpy(),
+        textposition='inside',
+        textinfo='percent+label'
+    ))
+    fig.update_layout(title="Distribución de Ganancias por Producto", height=500)
+    return fig
+
+# Función para generar el gráfico de ventas por fecha
+@st.cache_data(show_spinner=False, max_entries=10)
+def _figura_ventas_por_fecha(ventas_por_fecha):
+    """
+    Genera el gráfico de ganancias y unidades vendidas por fecha.
+    Se guarda en caché según el contenido de los datos agregados.
+    """
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+    
+    # Con historiales largos, agrupar por semana: más puntos no se distinguen y hacen lento el gráfico
+    if len(ventas_por_fecha) > 500:
+        ventas_por_fecha = ventas_por_fecha.set_index('Fecha').resample('W').sum().reset_index()
+    
+    # Ganancias y unidades vendidas en una sola figura con el eje de fechas compartido
+    fig = make_subplots(
+        rows=2,
+        cols=1,
+        shared_xaxes=True,
+        vertical_spacing=0.12,
+        subplot_titles=(
+            "💰 Evolución de Ganancias por Fecha",
+            "📦 Evolución de Unidades Vendidas por Fecha"
+        )
+    )
+    fig.add_trace(
+        go.Scattergl(
+            x=ventas_por_fecha['Fecha'].to_numpy(),
+            y=ventas_por_fecha['Ganancia'].to_numpy(),
+            name='Ganancia',
+            mode='lines+markers',
+            line=dict(color='green', width=3)
+        ),
+        row=1,
+        col=1
+    )
+    fig.add_trace(
+        go.Scattergl(
+            x=ventas_por_fecha['Fecha'].to_numpy(),
+            y=ventas_por_fecha['Cantidad Vendida'].to_numpy(),
+            name='Cantidad Vendida',
+            mode='lines+markers',
+            line=dict(color='blue', width=3)
+        ),
+        row=2,
+        col=1
+    )
+    fig.update_yaxes(title_text="Ganancia", row=1, col=1)
+    fig.update_yaxes(title_text="Unidades Vendidas", row=2, col=1)
+    fig.update_layout(height=800, showlegend=False, uirevision='fecha')
+    return fig
+
 # Función para generar dashboard de estadísticas
 def mostrar_dashboard_estadisticas():
     """
@@ -82,8 +231,23 @@ def mostrar_dashboard_estadisticas():
         st.info("📝 No hay datos de ventas disponibles para mostrar estadísticas.")
         return
     
-    # Convertir fecha a datetime
-    df_ventas['Fecha'] = pd.to_datetime(df_ventas['Fecha'])
+    # Agrupar una sola vez por producto y talla; los resúmenes por producto
+    # se obtienen de esta tabla reducida en lugar de recorrer todas las ventas
+    ventas_por_producto_talla = df_ventas.groupby(['Producto', 'Talla'], observed=True).agg(**{
+        'Cantidad Vendida': ('Cantidad Vendida', 'sum'),
+        'Ganancia': ('Ganancia', 'sum'),
+        'Costo Total': ('Costo', 'sum'),
+        'Registros': ('Costo', 'count')
+    }).reset_index()
+    
+    resumen_productos = ventas_por_producto_talla.groupby('Producto', observed=True).agg({
+        'Cantidad Vendida': 'sum',
+        'Ganancia': 'sum',
+        'Costo Total': 'sum',
+        'Registros': 'sum'
+    }).reset_index()
+    resumen_productos['Costo'] = resumen_productos['Costo Total'] / resumen_productos['Registros']  # Promedio del costo
+    resumen_productos = resumen_productos.drop(columns=['Costo Total', 'Registros'])
     
     # Métricas principales
     col1, col2, col3, col4 = st.columns(4)
@@ -97,12 +261,12 @@ def mostrar_dashboard_estadisticas():
         st.metric("📦 Productos Vendidos", f"{productos_vendidos:,}")
     
     with col3:
-        ventas_unicas = len(df_ventas['Archivo'].unique())
+        ventas_unicas = df_ventas['Archivo'].nunique()
         st.metric("🛒 Ventas Realizadas", f"{ventas_unicas:,}")
     
     with col4:
         if not df_ventas.empty:
-            promedio_venta = df_ventas.groupby('Archivo')['Ganancia'].sum().mean()
+            promedio_venta = df_ventas.groupby('Archivo', observed=True)['Ganancia'].sum().mean()
             st.metric("📈 Promedio por Venta", f"${promedio_venta:,.2f}")
     
     st.markdown("---")
@@ -113,14 +277,8 @@ def mostrar_dashboard_estadisticas():
     with col1:
         st.markdown("### 🏆 Productos Más Vendidos")
         
-        # Agrupar por producto y talla
-        ventas_por_producto_talla = df_ventas.groupby(['Producto', 'Talla']).agg({
-            'Cantidad Vendida': 'sum',
-            'Ganancia': 'sum'
-        }).reset_index()
-        
         # Crear columna combinada para mejor visualización
-        ventas_por_producto_talla['Producto_Talla'] = ventas_por_producto_talla['Producto'] + ' (Talla ' + ventas_por_producto_talla['Talla'].astype(str) + ')'
+        ventas_por_producto_talla['Producto_Talla'] = ventas_por_producto_talla['Producto'].astype(str) + ' (Talla ' + ventas_por_producto_talla['Talla'].astype(str) + ')'
         
         # Ordenar por cantidad vendida
         ventas_por_producto_talla = ventas_por_producto_talla.sort_values('Cantidad Vendida', ascending=True)
@@ -129,17 +287,7 @@ def mostrar_dashboard_estadisticas():
         top_productos = ventas_por_producto_talla.tail(10)
         
         if not top_productos.empty:
-            fig_productos = px.bar(
-                top_productos,
-                x='Cantidad Vendida',
-                y='Producto_Talla',
-                orientation='h',
-                title="Top 10 Productos/Tallas Más Vendidos",
-                labels={'Cantidad Vendida': 'Unidades Vendidas', 'Producto_Talla': 'Producto (Talla)'},
-                color='Cantidad Vendida',
-                color_continuous_scale='Blues'
-            )
-            fig_productos.update_layout(height=500)
+            fig_productos = _figura_top_productos(top_productos)
             st.plotly_chart(fig_productos, use_container_width=True)
         else:
             st.info("No hay datos suficientes para mostrar productos más vendidos")
@@ -148,18 +296,11 @@ def mostrar_dashboard_estadisticas():
         st.markdown("### 💵 Ganancias por Producto")
         
         # Ganancias por producto (sin talla)
-        ganancias_por_producto = df_ventas.groupby('Producto')['Ganancia'].sum().reset_index()
+        ganancias_por_producto = resumen_productos[['Producto', 'Ganancia']]
         ganancias_por_producto = ganancias_por_producto.sort_values('Ganancia', ascending=False)
         
         if not ganancias_por_producto.empty:
-            fig_ganancias = px.pie(
-                ganancias_por_producto,
-                values='Ganancia',
-                names='Producto',
-                title="Distribución de Ganancias por Producto"
-            )
-            fig_ganancias.update_traces(textposition='inside', textinfo='percent+label')
-            fig_ganancias.update_layout(height=500)
+            fig_ganancias = _figura_ganancias_por_producto(ganancias_por_producto)
             st.plotly_chart(fig_ganancias, use_container_width=True)
         else:
             st.info("No hay datos suficientes para mostrar ganancias por producto")
@@ -168,29 +309,18 @@ def mostrar_dashboard_estadisticas():
     st.markdown("### 📋 Detalle de Ganancias por Producto")
     
     # Crear tabla resumen
-    resumen_productos = df_ventas.groupby('Producto').agg({
-        'Cantidad Vendida': 'sum',
-        'Ganancia': 'sum',
-        'Costo': 'mean'  # Promedio del costo
-    }).reset_index()
-    
     resumen_productos['Ganancia por Unidad'] = resumen_productos['Ganancia'] / resumen_productos['Cantidad Vendida']
     resumen_productos = resumen_productos.sort_values('Ganancia', ascending=False)
     
-    # Formatear para mostrar
-    resumen_display = resumen_productos.copy()
-    resumen_display['Ganancia'] = resumen_display['Ganancia'].apply(lambda x: f"${x:,.2f}")
-    resumen_display['Costo'] = resumen_display['Costo'].apply(lambda x: f"${x:,.2f}")
-    resumen_display['Ganancia por Unidad'] = resumen_display['Ganancia por Unidad'].apply(lambda x: f"${x:,.2f}")
-    
+    # Formatear para mostrar (el formato de moneda se aplica en el cliente)
     st.dataframe(
-        resumen_display,
+        resumen_productos,
         column_config={
             "Producto": "Producto",
             "Cantidad Vendida": st.column_config.NumberColumn("Unidades Vendidas", format="%d"),
-            "Ganancia": "Ganancia Total",
-            "Costo": "Costo Promedio",
-            "Ganancia por Unidad": "Ganancia por Unidad"
+            "Ganancia": st.column_config.NumberColumn("Ganancia Total", format="$%.2f"),
+            "Costo": st.column_config.NumberColumn("Costo Promedio", format="$%.2f"),
+            "Ganancia por Unidad": st.column_config.NumberColumn("Ganancia por Unidad", format="$%.2f")
         },
         use_container_width=True
     )
@@ -199,41 +329,14 @@ def mostrar_dashboard_estadisticas():
     st.markdown("---")
     st.markdown("### 📅 Ventas por Fecha")
     
-    ventas_por_fecha = df_ventas.groupby('Fecha').agg({
+    ventas_por_fecha = df_ventas.groupby('Fecha', observed=True).agg({
         'Ganancia': 'sum',
         'Cantidad Vendida': 'sum'
     }).reset_index()
     
     if not ventas_por_fecha.empty:
-        # Gráfico de ganancias
-        st.markdown("#### 💰 Ganancias por Fecha")
-        fig_ganancias = px.line(
-            ventas_por_fecha,
-            x='Fecha',
-            y='Ganancia',
-            title='Evolución de Ganancias por Fecha',
-            markers=True,
-            line_shape='linear'
-        )
-        fig_ganancias.update_traces(line=dict(color='green', width=3))
-        fig_ganancias.update_layout(height=400)
-        st.plotly_chart(fig_ganancias, use_container_width=True)
-        
-        st.markdown("---")
-        
-        # Gráfico de unidades vendidas
-        st.markdown("#### 📦 Unidades Vendidas por Fecha")
-        fig_unidades = px.line(
-            ventas_por_fecha,
-            x='Fecha',
-            y='Cantidad Vendida',
-            title='Evolución de Unidades Vendidas por Fecha',
-            markers=True,
-            line_shape='linear'
-        )
-        fig_unidades.update_traces(line=dict(color='blue', width=3))
-        fig_unidades.update_layout(height=400)
-        st.plotly_chart(fig_unidades, use_container_width=True)
+        fig_fechas = _figura_ventas_por_fecha(ventas_por_fecha)
+        st.plotly_chart(fig_fechas, use_container_width=True)
 
 # Función para cargar el archivo maestro
 def cargar_archivo_maestro():
@@ -241,7 +344,7 @@ def cargar_archivo_maestro():
     Carga el archivo maestro de control de inventario
     """
     try:
-        df = pd.read_excel("CR_Control.xlsx")
+        df = _leer_excel_cacheado("CR_Control.xlsx", os.stat("CR_Control.xlsx").st_mtime_ns)
         return df
     except FileNotFoundError:
         st.error("No se encontró el archivo CR_Control.xlsx")
@@ -250,33 +353,62 @@ def cargar_archivo_maestro():
         st.error(f"Error al cargar el archivo: {str(e)}")
         return None
 
+# Función para guardar un archivo de forma atómica
+def guardar_archivo_atomico(df, ruta):
+    """
+    Guarda el DataFrame en un archivo temporal y luego reemplaza el destino,
+    para que una falla a mitad de la escritura no deje el archivo corrupto
+    """
+    # Nombre temporal único en el mismo directorio, para que dos sesiones que guardan
+    # a la vez no escriban el mismo archivo; se conserva la extensión real porque
+    # pandas elige y valida el motor según ella
+    nombre_base, extension = os.path.splitext(ruta)
+    ruta_temporal = f"{nombre_base}.{uuid.uuid4().hex}.tmp{extension}"
+    try:
+        if extension == ".parquet":
+            df.to_parquet(ruta_temporal, index=False, engine="pyarrow")
+        else:
+            with pd.ExcelWriter(ruta_temporal, engine="xlsxwriter", date_format="yyyy-mm-dd", datetime_format="yyyy-mm-dd") as writer:
+                df.to_excel(writer, index=False)
+        os.replace(ruta_temporal, ruta)
+    except Exception:
+        # No dejar archivos temporales si la escritura falla
+        if os.path.exists(ruta_temporal):
+            os.remove(ruta_temporal)
+        raise
+
 # Función para actualizar el archivo maestro
 def actualizar_archivo_maestro(compras_realizadas):
     """
     Actualiza el archivo maestro con las compras realizadas
     """
     try:
-        df_maestro = pd.read_excel("CR_Control.xlsx")
+        # Cargar el archivo al momento de guardar para no pisar cambios de otras sesiones;
+        # si no cambió desde la última lectura, se obtiene de la caché sin volver a leerlo
+        df_maestro = cargar_archivo_maestro()
+        if df_maestro is None:
+            return False
         
-        for compra in compras_realizadas:
-            # Buscar el producto en el archivo maestro
-            mask = (df_maestro['Producto'] == compra['Producto']) & \
-                   (df_maestro['Talla'] == compra['Talla'])
-            
-            if mask.any():
-                # Actualizar cantidad vendida
-                df_maestro.loc[mask, 'Cantidad vendida'] += compra['Cantidad']
-                
-                # Actualizar ganancia (Cantidad vendida * Costo)
-                df_maestro.loc[mask, 'Ganancia'] = \
-                    df_maestro.loc[mask, 'Cantidad vendida'] * df_maestro.loc[mask, 'Costo']
-                
-                # Actualizar cantidad sobrante (Cantidad inicial - Cantidad vendida)
-                df_maestro.loc[mask, 'Cantidad sobrante'] = \
-                    df_maestro.loc[mask, 'Cantidad inicial'] - df_maestro.loc[mask, 'Cantidad vendida']
+        # Sumar las cantidades compradas por producto y talla
+        cantidades = pd.DataFrame(compras_realizadas).groupby(['Producto', 'Talla'])['Cantidad'].sum()
+        
+        # Alinear las compras con las filas del archivo maestro
+        claves = pd.MultiIndex.from_frame(df_maestro[['Producto', 'Talla']])
+        mask = claves.isin(cantidades.index)
+        
+        # Actualizar cantidad vendida
+        df_maestro['Cantidad vendida'] += cantidades.reindex(claves, fill_value=0).to_numpy()
+        
+        # Actualizar ganancia (Cantidad vendida * Costo)
+        df_maestro.loc[mask, 'Ganancia'] = \
+            df_maestro.loc[mask, 'Cantidad vendida'] * df_maestro.loc[mask, 'Costo']
+        
+        # Actualizar cantidad sobrante (Cantidad inicial - Cantidad vendida)
+        df_maestro.loc[mask, 'Cantidad sobrante'] = \
+            df_maestro.loc[mask, 'Cantidad inicial'] - df_maestro.loc[mask, 'Cantidad vendida']
         
         # Guardar el archivo actualizado
-        df_maestro.to_excel("CR_Control.xlsx", index=False)
+        guardar_archivo_atomico(df_maestro, "CR_Control.xlsx")
         return True
         
     except Exception as e:
@@ -309,15 +441,28 @@ def guardar_compra_excel(compras_realizadas):
     try:
         # Crear DataFrame con las compras
         df_compra = pd.DataFrame(compras_realizadas)
-        df_compra['Fecha'] = datetime.now().strftime("%Y-%m-%d")
+        df_compra['Fecha'] = pd.Timestamp(datetime.now().date())
         
         # Reordenar columnas según especificación
         columnas_orden = ['Producto', 'SKU', 'Talla', 'Cantidad Vendida', 'Costo', 'Ganancia', 'Fecha']
         df_compra = df_compra[columnas_orden]
         
-        # Generar nombre único y guardar
+        # Columnas de texto como str: tallas o SKUs que mezclan números y letras
+        # (por ejemplo 40 y 'M') no se pueden guardar en una sola columna de Parquet
+        df_compra = df_compra.astype({'Producto': str, 'SKU': str, 'Talla': str})
+        
+        # Generar nombre único
         nombre_archivo = generar_nombre_archivo()
-        df_compra.to_excel(nombre_archivo, index=False)
+        ruta_parquet = os.path.splitext(nombre_archivo)[0] + ".parquet"
+        
+        # Guardar primero la copia en Parquet para el dashboard de estadísticas y luego el Excel;
+        # si el Excel falla se elimina la copia, para que la compra quede guardada completa o no se guarde
+        guardar_archivo_atomico(df_compra, ruta_parquet)
+        try:
+            guardar_archivo_atomico(df_compra, nombre_archivo)
+        except Exception:
+            os.remove(ruta_parquet)
+            raise
         
         return nombre_archivo
         
@@ -325,6 +470,303 @@ def guardar_compra_excel(compras_realizadas):
         st.error(f"Error al guardar la compra: {str(e)}")
         return None
 
+# Función para mostrar la pantalla de inicio
+@st.fragment
+def pantalla_inicio():
+    """
+    Muestra la pantalla de bienvenida del sistema de ventas
+    """
+    st.markdown("### Bienvenido al Sistema de Registro de Compras")
+    st.markdown("Presiona el botón para comenzar una nueva compra")
+    
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col2:
+        if st.button("🛍️ Generar Nueva Compra", use_container_width=True, type="primary"):
+            st.session_state.estado = 'seleccionar_producto'
+            st.rerun()
+
+# Función para mostrar la pantalla de selección de producto
+@st.fragment
+def pantalla_seleccionar_producto(df_maestro):
+    """
+    Muestra los productos disponibles para agregar a la compra
+    """
+    st.markdown("### Seleccionar Producto")
+    
+    # Obtener productos únicos
+    productos_disponibles = df_maestro['Producto'].unique()
+    
+    # Mostrar productos en una grilla
+    cols = st.columns(3)
+    for i, producto in enumerate(productos_disponibles):
+        with cols[i % 3]:
+            if st.button(f"📦 {producto}", key=f"prod_{i}", use_container_width=True):
+                st.session_state.producto_seleccionado = producto
+                st.session_state.estado = 'seleccionar_talla'
+                st.rerun()
+    
+    # Botón para volver al carrito si hay artículos
+    if st.session_state.carrito:
+        st.markdown("---")
+        if st.button("🛒 Ver Carrito", type="secondary"):
+            st.session_state.estado = 'carrito'
+            st.rerun()
+
+# Función para mostrar la pantalla de selección de talla
+@st.fragment
+def pantalla_seleccionar_talla(df_maestro):
+    """
+    Muestra las tallas y el stock del producto seleccionado
+    """
+    st.markdown(f"### Seleccionar Talla para: {st.session_state.producto_seleccionado}")
+    
+    # Filtrar una sola vez las filas del producto seleccionado
+    producto_info = df_maestro[df_maestro['Producto'] == st.session_state.producto_seleccionado]
+    
+    # Tallas disponibles y stock por talla a partir del mismo filtro
+    tallas_disponibles = producto_info['Talla'].unique()
+    stocks = dict(zip(producto_info['Talla'], producto_info['Cantidad sobrante']))
+    
+    # Ordenar tallas según el orden especificado
+    tallas_ordenadas = ordenar_tallas(tuple(tallas_disponibles))
+    
+    # Mostrar información del producto
+    st.markdown("#### Información del Producto:")
+    # Nombres de columna válidos como atributos para recorrer con itertuples
+    filas_producto = producto_info.rename(columns={
+        'Cantidad inicial': 'inicial',
+        'Cantidad vendida': 'vendida',
+        'Cantidad sobrante': 'sobrante'
+    })
+    for row in filas_producto.itertuples(index=False):
+        # Determinar color del expander según stock
+        stock = row.sobrante
+        if stock == 0:
+            titulo = f"🔴 Talla {row.Talla} - AGOTADO"
+        elif stock <= 5:
+            titulo = f"🟡 Talla {row.Talla} - STOCK BAJO: {stock} unidades"
+        else:
+            titulo = f"🟢 Talla {row.Talla} - Disponible: {stock} unidades"
+        
+        with st.expander(titulo):
+            col1, col2 = st.columns(2)
+            with col1:
+                st.write(f"**SKU:** {row.SKU}")
+                st.write(f"**Costo:** ${row.Costo:,.2f}")
+            with col2:
+                st.write(f"**Cantidad inicial:** {row.inicial}")
+                st.write(f"**Cantidad vendida:** {row.vendida}")
+    
+    # Selección de talla con orden específico
+    st.markdown("#### Seleccionar Talla:")
+    cols = st.columns(len(tallas_ordenadas))
+    for i, talla in enumerate(tallas_ordenadas):
+        with cols[i]:
+            # Verificar stock para esta talla
+            stock_talla = stocks[talla]
+            
+            button_disabled = stock_talla == 0
+            button_text = f"Talla {talla}" if not button_disabled else f"Talla {talla} (Agotado)"
+            
+            if st.button(button_text, key=f"talla_{i}", use_container_width=True, disabled=button_disabled):
+                st.session_state.talla_seleccionada = talla
+                st.session_state.estado = 'confirmar_articulo'
+                st.rerun()
+    
+    # Botón para regresar
+    st.markdown("---")
+    if st.button("⬅️ Regresar a Productos"):
+        st.session_state.estado = 'seleccionar_producto'
+        st.rerun()
+
+# Función para mostrar la pantalla de confirmación de artículo
+@st.fragment
+def pantalla_confirmar_articulo(df_maestro):
+    """
+    Muestra el artículo seleccionado y permite elegir la cantidad
+    """
+    st.markdown("### Confirmar Artículo")
+    
+    # Obtener información del artículo seleccionado
+    articulo_info = df_maestro[
+        (df_maestro['Producto'] == st.session_state.producto_seleccionado) &
+        (df_maestro['Talla'] == st.session_state.talla_seleccionada)
+    ].iloc[0]
+    
+    # Mostrar información del artículo
+    col1, col2 = st.columns(2)
+    with col1:
+        st.info(f"""
+        **Producto:** {articulo_info['Producto']}
+        **SKU:** {articulo_info['SKU']}
+        **Talla:** {articulo_info['Talla']}
+        """)
+    
+    with col2:
+        st.success(f"""
+        **Costo:** ${articulo_info['Costo']:,.2f}
+        **Disponible:** {articulo_info['Cantidad sobrante']} unidades
+        """)
+    
+    # Seleccionar cantidad
+    cantidad_maxima = int(articulo_info['Cantidad sobrante'])
+    if cantidad_maxima > 0:
+        cantidad = st.number_input(
+            "Cantidad a comprar:",
+            min_value=1,
+            max_value=cantidad_maxima,
+            value=1,
+            step=1
+        )
+        
+        st.markdown("---")
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            if st.button("➕ Agregar Artículo a la Compra", type="primary", use_container_width=True):
+                # Agregar al carrito
+                nuevo_articulo = {
+                    'Producto': articulo_info['Producto'],
+                    'SKU': articulo_info['SKU'],
+                    'Talla': articulo_info['Talla'],
+                    'Cantidad': cantidad,
+                    'Cantidad Vendida': cantidad,  # Para el archivo de compra
+                    'Costo': articulo_info['Costo'],
+                    'Ganancia': cantidad * articulo_info['Costo']
+                }
+                st.session_state.carrito.append(nuevo_articulo)
+                st.session_state.estado = 'carrito'
+                st.success(f"✅ {cantidad} unidad(es) agregada(s) al carrito")
+                st.rerun()
+        
+        with col2:
+            if st.button("⬅️ Cambiar Selección", use_container_width=True):
+                st.session_state.estado = 'seleccionar_producto'
+                st.rerun()
+    else:
+        st.error("❌ No hay stock disponible para este artículo")
+        if st.button("⬅️ Seleccionar Otro Producto"):
+            st.session_state.estado = 'seleccionar_producto'
+            st.rerun()
+
+# Función para mostrar la pantalla del carrito
+@st.fragment
+def pantalla_carrito():
+    """
+    Muestra los artículos del carrito y el total de la compra
+    """
+    st.markdown("### 🛒 Carrito de Compras")
+    
+    if st.session_state.carrito:
+        # Mostrar artículos en el carrito
+        total_compra = 0
+        
+        for i, articulo in enumerate(st.session_state.carrito):
+            with st.expander(f"Artículo {i+1}: {articulo['Producto']} - Talla {articulo['Talla']}", expanded=True):
+                col1, col2, col3 = st.columns([2, 1, 1])
+                with col1:
+                    st.write(f"**SKU:** {articulo['SKU']}")
+                    st.write(f"**Cantidad:** {articulo['Cantidad']}")
+                with col2:
+                    st.write(f"**Precio unitario:** ${articulo['Costo']:,.2f}")
+                    st.write(f"**Subtotal:** ${articulo['Ganancia']:,.2f}")
+                with col3:
+                    if st.button(f"🗑️ Eliminar", key=f"eliminar_{i}"):
+                        st.session_state.carrito.pop(i)
+                        st.rerun(scope="fragment")
+            
+            total_compra += articulo['Ganancia']
+        
+        # Mostrar total
+        st.markdown("---")
+        st.markdown(f"### 💰 Total de la Compra: ${total_compra:,.2f}")
+        
+        # Botones de acción
+        col1, col2, col3 = st.columns(3)
+        
+        with col1:
+            if st.button("➕ Agregar Más Artículos", use_container_width=True):
+                st.session_state.estado = 'seleccionar_producto'
+                st.rerun()
+        
+        with col2:
+            if st.button("✅ Finalizar Compra", type="primary", use_container_width=True):
+                st.session_state.estado = 'finalizar_compra'
+                st.rerun()
+        
+        with col3:
+            if st.button("🗑️ Vaciar Carrito", use_container_width=True):
+                st.session_state.carrito = []
+                st.rerun(scope="fragment")
+    
+    else:
+        st.info("El carrito está vacío")
+        if st.button("➕ Agregar Artículos"):
+            st.session_state.estado = 'seleccionar_producto'
+            st.rerun()
+
+# Función para mostrar la pantalla de finalización de compra
+@st.fragment
+def pantalla_finalizar_compra():
+    """
+    Muestra el resumen final y guarda la compra
+    """
+    # Después de guardar, el estado ya es 'inicio': volver a ejecutar la app completa
+    if st.session_state.estado != 'finalizar_compra':
+        st.rerun()
+    
+    st.markdown("### ✅ Finalizar Compra")
+    
+    if st.session_state.carrito:
+        # Mostrar resumen final
+        st.markdown("#### Resumen de la Compra:")
+        
+        # Mostrar el carrito directamente (el formato de moneda se aplica en el cliente)
+        st.dataframe(
+            st.session_state.carrito,
+            column_order=('Producto', 'Talla', 'Cantidad', 'Costo', 'Ganancia'),
+            column_config={
+                "Costo": st.column_config.NumberColumn("Costo", format="$%.2f"),
+                "Ganancia": st.column_config.NumberColumn("Ganancia", format="$%.2f")
+            },
+            use_container_width=True
+        )
+        
+        total_final = sum(articulo['Ganancia'] for articulo in st.session_state.carrito)
+        st.markdown(f"### 💰 **Total Final: ${total_final:,.2f}**")
+        
+        st.markdown("---")
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            if st.button("💾 Confirmar y Guardar Compra", type="primary", use_container_width=True):
+                # Guardar compra en Excel
+                nombre_archivo = guardar_compra_excel(st.session_state.carrito)
+                
+                if nombre_archivo:
+                    # Actualizar archivo maestro
+                    if actualizar_archivo_maestro(st.session_state.carrito):
+                        st.success(f"✅ Compra guardada exitosamente en: {nombre_archivo}")
+                        st.success("✅ Archivo maestro actualizado correctamente")
+                        
+                        # Limpiar carrito y regresar al inicio
+                        st.session_state.carrito = []
+                        st.session_state.estado = 'inicio'
+                        st.balloons()
+                        
+                        # Botón para nueva compra
+                        if st.button("🛍️ Nueva Compra"):
+                            st.rerun()
+                    else:
+                        st.error("❌ Error al actualizar el archivo maestro")
+                else:
+                    st.error("❌ Error al guardar la compra")
+        
+        with col2:
+            if st.button("⬅️ Regresar al Carrito", use_container_width=True):
+                st.session_state.estado = 'carrito'
+                st.rerun()
+
 # Inicializar estados de sesión
 if 'estado' not in st.session_state:
     st.session_state.estado = 'inicio'
@@ -368,265 +810,27 @@ def main():
     
     # Pantalla de inicio
     if st.session_state.estado == 'inicio':
-        st.markdown("### Bienvenido al Sistema de Registro de Compras")
-        st.markdown("Presiona el botón para comenzar una nueva compra")
-        
-        col1, col2, col3 = st.columns([1, 2, 1])
-        with col2:
-            if st.button("🛍️ Generar Nueva Compra", use_container_width=True, type="primary"):
-                st.session_state.estado = 'seleccionar_producto'
-                st.rerun()
+        pantalla_inicio()
     
     # Pantalla de selección de producto
     elif st.session_state.estado == 'seleccionar_producto':
-        st.markdown("### Seleccionar Producto")
-        
-        # Obtener productos únicos
-        productos_disponibles = df_maestro['Producto'].unique()
-        
-        # Mostrar productos en una grilla
-        cols = st.columns(3)
-        for i, producto in enumerate(productos_disponibles):
-            with cols[i % 3]:
-                if st.button(f"📦 {producto}", key=f"prod_{i}", use_container_width=True):
-                    st.session_state.producto_seleccionado = producto
-                    st.session_state.estado = 'seleccionar_talla'
-                    st.rerun()
-        
-        # Botón para volver al carrito si hay artículos
-        if st.session_state.carrito:
-            st.markdown("---")
-            if st.button("🛒 Ver Carrito", type="secondary"):
-                st.session_state.estado = 'carrito'
-                st.rerun()
+        pantalla_seleccionar_producto(df_maestro)
     
     # Pantalla de selección de talla
     elif st.session_state.estado == 'seleccionar_talla':
-        st.markdown(f"### Seleccionar Talla para: {st.session_state.producto_seleccionado}")
-        
-        # Filtrar tallas disponibles para el producto seleccionado
-        tallas_disponibles = df_maestro[
-            df_maestro['Producto'] == st.session_state.producto_seleccionado
-        ]['Talla'].unique()
-        
-        # Ordenar tallas según el orden especificado
-        tallas_ordenadas = ordenar_tallas(tallas_disponibles)
-        
-        # Mostrar información del producto
-        producto_info = df_maestro[df_maestro['Producto'] == st.session_state.producto_seleccionado]
-        
-        st.markdown("#### Información del Producto:")
-        for _, row in producto_info.iterrows():
-            # Determinar color del expander según stock
-            stock = row['Cantidad sobrante']
-            if stock == 0:
-                titulo = f"🔴 Talla {row['Talla']} - AGOTADO"
-            elif stock <= 5:
-                titulo = f"🟡 Talla {row['Talla']} - STOCK BAJO: {stock} unidades"
-            else:
-                titulo = f"🟢 Talla {row['Talla']} - Disponible: {stock} unidades"
-            
-            with st.expander(titulo):
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.write(f"**SKU:** {row['SKU']}")
-                    st.write(f"**Costo:** ${row['Costo']:,.2f}")
-                with col2:
-                    st.write(f"**Cantidad inicial:** {row['Cantidad inicial']}")
-                    st.write(f"**Cantidad vendida:** {row['Cantidad vendida']}")
-        
-        # Selección de talla con orden específico
-        st.markdown("#### Seleccionar Talla:")
-        cols = st.columns(len(tallas_ordenadas))
-        for i, talla in enumerate(tallas_ordenadas):
-            with cols[i]:
-                # Verificar stock para esta talla
-                stock_talla = df_maestro[
-                    (df_maestro['Producto'] == st.session_state.producto_seleccionado) &
-                    (df_maestro['Talla'] == talla)
-                ]['Cantidad sobrante'].iloc[0]
-                
-                button_disabled = stock_talla == 0
-                button_text = f"Talla {talla}" if not button_disabled else f"Talla {talla} (Agotado)"
-                
-                if st.button(button_text, key=f"talla_{i}", use_container_width=True, disabled=button_disabled):
-                    st.session_state.talla_seleccionada = talla
-                    st.session_state.estado = 'confirmar_articulo'
-                    st.rerun()
-        
-        # Botón para regresar
-        st.markdown("---")
-        if st.button("⬅️ Regresar a Productos"):
-            st.session_state.estado = 'seleccionar_producto'
-            st.rerun()
+        pantalla_seleccionar_talla(df_maestro)
     
     # Pantalla de confirmación de artículo
     elif st.session_state.estado == 'confirmar_articulo':
-        st.markdown("### Confirmar Artículo")
-        
-        # Obtener información del artículo seleccionado
-        articulo_info = df_maestro[
-            (df_maestro['Producto'] == st.session_state.producto_seleccionado) &
-            (df_maestro['Talla'] == st.session_state.talla_seleccionada)
-        ].iloc[0]
-        
-        # Mostrar información del artículo
-        col1, col2 = st.columns(2)
-        with col1:
-            st.info(f"""
-            **Producto:** {articulo_info['Producto']}
-            **SKU:** {articulo_info['SKU']}
-            **Talla:** {articulo_info['Talla']}
-            """)
-        
-        with col2:
-            st.success(f"""
-            **Costo:** ${articulo_info['Costo']:,.2f}
-            **Disponible:** {articulo_info['Cantidad sobrante']} unidades
-            """)
-        
-        # Seleccionar cantidad
-        cantidad_maxima = int(articulo_info['Cantidad sobrante'])
-        if cantidad_maxima > 0:
-            cantidad = st.number_input(
-                "Cantidad a comprar:",
-                min_value=1,
-                max_value=cantidad_maxima,
-                value=1,
-                step=1
-            )
-            
-            st.markdown("---")
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                if st.button("➕ Agregar Artículo a la Compra", type="primary", use_container_width=True):
-                    # Agregar al carrito
-                    nuevo_articulo = {
-                        'Producto': articulo_info['Producto'],
-                        'SKU': articulo_info['SKU'],
-                        'Talla': articulo_info['Talla'],
-                        'Cantidad': cantidad,
-                        'Cantidad Vendida': cantidad,  # Para el archivo de compra
-                        'Costo': articulo_info['Costo'],
-                        'Ganancia': cantidad * articulo_info['Costo']
-                    }
-                    st.session_state.carrito.append(nuevo_articulo)
-                    st.session_state.estado = 'carrito'
-                    st.success(f"✅ {cantidad} unidad(es) agregada(s) al carrito")
-                    st.rerun()
-            
-            with col2:
-                if st.button("⬅️ Cambiar Selección", use_container_width=True):
-                    st.session_state.estado = 'seleccionar_producto'
-                    st.rerun()
-        else:
-            st.error("❌ No hay stock disponible para este artículo")
-            if st.button("⬅️ Seleccionar Otro Producto"):
-                st.session_state.estado = 'seleccionar_producto'
-                st.rerun()
+        pantalla_confirmar_articulo(df_maestro)
     
     # Pantalla del carrito
     elif st.session_state.estado == 'carrito':
-        st.markdown("### 🛒 Carrito de Compras")
-        
-        if st.session_state.carrito:
-            # Mostrar artículos en el carrito
-            total_compra = 0
-            
-            for i, articulo in enumerate(st.session_state.carrito):
-                with st.expander(f"Artículo {i+1}: {articulo['Producto']} - Talla {articulo['Talla']}", expanded=True):
-                    col1, col2, col3 = st.columns([2, 1, 1])
-                    with col1:
-                        st.write(f"**SKU:** {articulo['SKU']}")
-                        st.write(f"**Cantidad:** {articulo['Cantidad']}")
-                    with col2:
-                        st.write(f"**Precio unitario:** ${articulo['Costo']:,.2f}")
-                        st.write(f"**Subtotal:** ${articulo['Ganancia']:,.2f}")
-                    with col3:
-                        if st.button(f"🗑️ Eliminar", key=f"eliminar_{i}"):
-                            st.session_state.carrito.pop(i)
-                            st.rerun()
-                
-                total_compra += articulo['Ganancia']
-            
-            # Mostrar total
-            st.markdown("---")
-            st.markdown(f"### 💰 Total de la Compra: ${total_compra:,.2f}")
-            
-            # Botones de acción
-            col1, col2, col3 = st.columns(3)
-            
-            with col1:
-                if st.button("➕ Agregar Más Artículos", use_container_width=True):
-                    st.session_state.estado = 'seleccionar_producto'
-                    st.rerun()
-            
-            with col2:
-                if st.button("✅ Finalizar Compra", type="primary", use_container_width=True):
-                    st.session_state.estado = 'finalizar_compra'
-                    st.rerun()
-            
-            with col3:
-                if st.button("🗑️ Vaciar Carrito", use_container_width=True):
-                    st.session_state.carrito = []
-                    st.rerun()
-        
-        else:
-            st.info("El carrito está vacío")
-            if st.button("➕ Agregar Artículos"):
-                st.session_state.estado = 'seleccionar_producto'
-                st.rerun()
+        pantalla_carrito()
     
     # Pantalla de finalización de compra
     elif st.session_state.estado == 'finalizar_compra':
-        st.markdown("### ✅ Finalizar Compra")
-        
-        if st.session_state.carrito:
-            # Mostrar resumen final
-            st.markdown("#### Resumen de la Compra:")
-            
-            df_resumen = pd.DataFrame(st.session_state.carrito)
-            df_resumen_display = df_resumen[['Producto', 'Talla', 'Cantidad', 'Costo', 'Ganancia']].copy()
-            df_resumen_display['Costo'] = df_resumen_display['Costo'].apply(lambda x: f"${x:,.2f}")
-            df_resumen_display['Ganancia'] = df_resumen_display['Ganancia'].apply(lambda x: f"${x:,.2f}")
-            
-            st.dataframe(df_resumen_display, use_container_width=True)
-            
-            total_final = sum(articulo['Ganancia'] for articulo in st.session_state.carrito)
-            st.markdown(f"### 💰 **Total Final: ${total_final:,.2f}**")
-            
-            st.markdown("---")
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                if st.button("💾 Confirmar y Guardar Compra", type="primary", use_container_width=True):
-                    # Guardar compra en Excel
-                    nombre_archivo = guardar_compra_excel(st.session_state.carrito)
-                    
-                    if nombre_archivo:
-                        # Actualizar archivo maestro
-                        if actualizar_archivo_maestro(st.session_state.carrito):
-                            st.success(f"✅ Compra guardada exitosamente en: {nombre_archivo}")
-                            st.success("✅ Archivo maestro actualizado correctamente")
-                            
-                            # Limpiar carrito y regresar al inicio
-                            st.session_state.carrito = []
-                            st.session_state.estado = 'inicio'
-                            st.balloons()
-                            
-                            # Botón para nueva compra
-                            if st.button("🛍️ Nueva Compra"):
-                                st.rerun()
-                        else:
-                            st.error("❌ Error al actualizar el archivo maestro")
-                    else:
-                        st.error("❌ Error al guardar la compra")
-            
-            with col2:
-                if st.button("⬅️ Regresar al Carrito", use_container_width=True):
-                    st.session_state.estado = 'carrito'
-                    st.rerun()
+        pantalla_finalizar_compra()
 
 # Ejecutar la aplicación
 if __name__ == "__main__":